@@ -34,7 +34,7 @@ def predict_image(image_path):
     input_tensor = transform(image).unsqueeze(0).to(DEVICE)
 
     # Load trained model
-    model = EfficientNetOrdinal(NUM_CLASSES).to(DEVICE)
+    model = EfficientNetOrdinal(NUM_CLASSES, pretrained=False).to(DEVICE)
     model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
     model.eval()
 
@@ -1,37 +1,211 @@
 import os
+import numpy as np
 from PIL import Image
-from torch.utils.data import Dataset
+import torch
+from torch.utils.data import Dataset, WeightedRandomSampler
 import torchvision.transforms as transforms
 
+# Manifest file written inside each split folder (train/val/test)
+MANIFEST_NAME = "manifest.npz"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+# Per-image arrays; the other manifest entries describe the split as a whole
+ENTRY_KEYS = ("paths", "labels", "sizes", "mtimes")
+
+
+# ------------------------------
+# Manifest index
+# ------------------------------
+
+def build_manifest(root_dir):
+    """
+    Walk root_dir once and return the manifest as a dict of numpy arrays.
+    Expecting folder structure: root_dir/0/, root_dir/1/, ..., root_dir/4/
+    paths are stored relative to root_dir as fixed-width bytes so DataLoader
+    workers share them without copying Python objects.
+    """
+    paths, labels, sizes, mtimes = [], [], [], []
+    folders, folder_mtimes = [], []
+
+    for label in _label_folders(root_dir):
+        label_folder = os.path.join(root_dir, label)
+
+        # Adding/removing a file changes the folder mtime, which validate_manifest checks
+        folders.append(os.fsencode(label))
+        folder_mtimes.append(os.stat(label_folder).st_mtime_ns)
+
+        with os.scandir(label_folder) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext not in IMAGE_EXTENSIONS or not entry.is_file():
+                    continue
+
+                stat = entry.stat()
+                paths.append(os.fsencode(os.path.join(label, entry.name)))
+                labels.append(int(label))  # folder name is the integer label
+                sizes.append(stat.st_size)
+                mtimes.append(stat.st_mtime_ns)
+
+    labels = np.array(labels, dtype=np.int64)
+    num_classes = int(labels.max()) + 1 if len(labels) else 0
+
+    return {
+        "paths": np.array(paths, dtype=np.bytes_),
+        "labels": labels,
+        "sizes": np.array(sizes, dtype=np.int64),
+        "mtimes": np.array(mtimes, dtype=np.int64),
+        "class_counts": np.bincount(labels, minlength=num_classes),
+        "folders": np.array(folders, dtype=np.bytes_),
+        "folder_mtimes": np.array(folder_mtimes, dtype=np.int64),
+    }
+
+
+def _label_folders(root_dir):
+    """Sorted names of the integer label folders in root_dir"""
+    return [label for label in sorted(os.listdir(root_dir))
+            if label.isdigit() and os.path.isdir(os.path.join(root_dir, label))]
+
+
+def save_manifest(manifest, path):
+    """
+    Write the manifest atomically so readers never see a partial file.
+    Returns False (manifest stays in memory only) if the location is not writable,
+    e.g. a read-only dataset mount.
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **manifest)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print(f"Could not write manifest {path} ({e}); using it in memory only")
+        return False
+    return True
+
+
+def load_manifest(path):
+    """Load a manifest written by save_manifest."""
+    with np.load(path) as data:
+        manifest = {key: data[key] for key in data.files}
+
+    # Manifests filtered by other tools may not carry fresh counts
+    manifest["class_counts"] = np.bincount(
+        manifest["labels"], minlength=len(manifest.get("class_counts", []))
+    )
+    return manifest
+
+
+def validate_manifest(manifest, root_dir, check_files=True):
+    """
+    Check the manifest against disk: label folders (set + mtime, so added or removed
+    images are caught; a few stat calls) and, with check_files, every entry (size + mtime).
+    Returns the list of relative paths (files or folders) that are missing or changed.
+    """
+    stale = []
+
+    if "folders" not in manifest:
+        return [root_dir]  # written before folder tracking existed
+
+    recorded = dict(zip((os.fsdecode(f) for f in manifest["folders"]), manifest["folder_mtimes"]))
+    current = _label_folders(root_dir)
+    for label in sorted(set(recorded) | set(current)):
+        if label not in recorded or label not in current:
+            stale.append(label)
+        elif os.stat(os.path.join(root_dir, label)).st_mtime_ns != recorded[label]:
+            stale.append(label)
+
+    if not check_files:
+        return stale
+
+    for rel_path, size, mtime in zip(manifest["paths"], manifest["sizes"], manifest["mtimes"]):
+        rel_path = os.fsdecode(rel_path)
+        try:
+            stat = os.stat(os.path.join(root_dir, rel_path))
+        except FileNotFoundError:
+            stale.append(rel_path)
+            continue
+
+        if stat.st_size != size or stat.st_mtime_ns != mtime:
+            stale.append(rel_path)
+
+    return stale
+
+
+def get_manifest(root_dir, manifest_path=None, rebuild=False, validate=False, rebuildable=True):
+    """
+    Return the manifest for root_dir, building and saving it on first use.
+    The label folders are always checked, so added or removed images trigger a rebuild;
+    validate=True also checks every file's size/mtime.
+    rebuildable=False is for filtered manifests (e.g. from dedup.py): they are load-only,
+    since re-walking the split would silently replace them with the full index.
+    """
+    if manifest_path is None:
+        manifest_path = os.path.join(root_dir, MANIFEST_NAME)
+
+    if not rebuildable:
+        if rebuild:
+            raise ValueError(f"{manifest_path} is a filtered manifest and cannot be rebuilt; "
+                             "re-run the tool that produced it")
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"Manifest not found: {manifest_path}")
+
+        manifest = load_manifest(manifest_path)
+        stale = validate_manifest(manifest, root_dir, check_files=validate)
+        if stale:
+            raise ValueError(f"{len(stale)} stale entries in {manifest_path} "
+                             f"(e.g. {', '.join(stale[:5])}); re-run the tool that produced it")
+        return manifest
+
+    if not rebuild and os.path.exists(manifest_path):
+        manifest = load_manifest(manifest_path)
+        if not validate_manifest(manifest, root_dir, check_files=validate):
+            return manifest
+
+    manifest = build_manifest(root_dir)
+    save_manifest(manifest, manifest_path)
+    return manifest
+
+
+# ------------------------------
+# Dataset
+# ------------------------------
+
 class RAOrdinalDataset(Dataset):
-    def __init__(self, root_dir, transform=None):
+    def __init__(self, root_dir, transform=None, manifest_name=None, manifest_path=None,
+                 rebuild_manifest=False, validate_files=False):
         """
         root_dir: dataset split folder (train/val/test)
         transform: torchvision transforms for augmentation & resizing
+        manifest_name: manifest file inside root_dir (default: manifest.npz, the rebuildable cache).
+                       Any other name, e.g. "manifest_dedup.npz", is load-only.
+        manifest_path: load-only manifest stored elsewhere (overrides manifest_name)
+        rebuild_manifest: re-walk root_dir even if a manifest exists (cache only)
+        validate_files: also check each file's size/mtime (label folders are always checked);
+                        the cache is rebuilt if stale, a load-only manifest raises ValueError
+                        listing the stale entries
         """
         self.root_dir = root_dir
         self.transform = transform
 
-        self.image_paths = []
-        self.labels = []
-
-        # Expecting folder structure: root_dir/0/, root_dir/1/, ..., root_dir/4/
-        for label in os.listdir(root_dir):
-            label_folder = os.path.join(root_dir, label)
+        rebuildable = manifest_path is None and manifest_name in (None, MANIFEST_NAME)
+        if manifest_path is None and manifest_name is not None:
+            manifest_path = os.path.join(root_dir, manifest_name)
 
-            if not os.path.isdir(label_folder):
-                continue
+        manifest = get_manifest(root_dir, manifest_path, rebuild=rebuild_manifest,
+                                validate=validate_files, rebuildable=rebuildable)
 
-            for img_name in os.listdir(label_folder):
-                self.image_paths.append(os.path.join(label_folder, img_name))
-                self.labels.append(int(label))  # convert folder name to integer label
+        # numpy arrays instead of lists: no per-item refcounts to copy in workers
+        self.image_paths = manifest["paths"]
+        self.labels = manifest["labels"]
+        self.class_counts = manifest["class_counts"]
 
     def __len__(self):
         return len(self.image_paths)
 
     def __getitem__(self, idx):
-        img_path = self.image_paths[idx]
-        label = self.labels[idx]
+        img_path = os.path.join(self.root_dir, os.fsdecode(self.image_paths[idx]))
+        label = int(self.labels[idx])
 
         image = Image.open(img_path).convert("RGB")
 
@@ -39,3 +213,31 @@ class RAOrdinalDataset(Dataset):
             image = self.transform(image)
 
         return image, label
+
+
+# ------------------------------
+# Class-balanced sampling
+# ------------------------------
+
+def make_weighted_sampler(dataset, grade_weights=None, num_samples=None):
+    """
+    Build a WeightedRandomSampler from the dataset's manifest counts.
+    grade_weights=None → class-balanced (every KL grade drawn equally often).
+    grade_weights=[w0, ..., w4] → grade k is drawn in proportion to w_k.
+    """
+    if grade_weights is None:
+        grade_weights = np.ones(len(dataset.class_counts))
+    grade_weights = np.asarray(grade_weights, dtype=np.float64)
+
+    if len(grade_weights) < len(dataset.class_counts):
+        raise ValueError(f"Expected {len(dataset.class_counts)} grade weights, got {len(grade_weights)}")
+
+    counts = np.bincount(dataset.labels, minlength=len(grade_weights)).astype(np.float64)
+
+    per_class = np.divide(grade_weights, counts, out=np.zeros_like(counts), where=counts > 0)
+    sample_weights = torch.from_numpy(per_class[dataset.labels])
+
+    if num_samples is None:
+        num_samples = len(dataset)
+
+    return WeightedRandomSampler(sample_weights, num_samples=num_samples, replacement=True)
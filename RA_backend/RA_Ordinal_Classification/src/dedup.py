@@ -0,0 +1,241 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from dataset import get_manifest, save_manifest, ENTRY_KEYS
+
+# ------------------------------
+# Config
+# ------------------------------
+DATA_DIR = "data/RA"
+SPLITS = ["train", "val", "test"]
+# When a cluster spans splits, the copy in the earliest split listed here is kept
+KEEP_PRIORITY = ["test", "val", "train"]
+MAX_DISTANCE = 6             # Hamming distance (out of 64 bits) treated as a duplicate
+HASH_SIZE = 8                # 8x8 low-frequency DCT block → 64-bit hash
+HIGHFREQ_FACTOR = 4          # images are reduced to 32x32 before the DCT
+DEDUP_MANIFEST_NAME = "manifest_dedup.npz"
+REPORT_PATH = "results/duplicates.csv"
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+# ------------------------------
+# Perceptual hashing
+# ------------------------------
+def _load_small(path):
+    """Grayscale, downscaled pixels for the DCT (runs in worker processes)"""
+    size = HASH_SIZE * HIGHFREQ_FACTOR
+    with Image.open(path) as img:
+        img.draft("L", (size, size))  # lets JPEG decode at reduced scale
+        return np.asarray(img.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float32)
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, np.newaxis]
+    x = np.arange(n)[np.newaxis, :]
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * n)).astype(np.float32)
+
+
+def phash_batch(pixels):
+    """
+    DCT perceptual hash for a stack of images (N, 32, 32) → uint64 array (N,)
+    Bits are set where a low-frequency coefficient exceeds that image's median.
+    """
+    d = _dct_matrix(pixels.shape[1])
+    coeffs = np.einsum("kn,bnm,lm->bkl", d, pixels, d)[:, :HASH_SIZE, :HASH_SIZE]
+    coeffs = coeffs.reshape(len(pixels), -1)
+    bits = coeffs > np.median(coeffs, axis=1, keepdims=True)
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def compute_hashes(paths, workers=None):
+    """Decode images in parallel, then hash them in one vectorized pass"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pixels = list(pool.map(_load_small, paths, chunksize=64))
+    return phash_batch(np.stack(pixels))
+
+
+def hamming(a, b):
+    """Element-wise Hamming distance between uint64 arrays"""
+    xor = np.bitwise_xor(a, b)
+    return _POPCOUNT[xor.view(np.uint8)].reshape(len(xor), 8).sum(axis=1)
+
+
+# ------------------------------
+# Multi-index hashing
+# ------------------------------
+def find_duplicate_pairs(hashes, max_distance=MAX_DISTANCE):
+    """
+    All pairs (i, j) with Hamming distance <= max_distance, without comparing all pairs.
+    The 64-bit hash is split into max_distance + 1 substrings; by the pigeonhole principle
+    two hashes within max_distance agree exactly on at least one substring, so only pairs
+    sharing a bucket in some substring table are verified.
+    """
+    num_chunks = max_distance + 1
+    bounds = np.linspace(0, 64, num_chunks + 1).astype(int)
+    n = len(hashes)
+    candidates = []
+
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        mask = np.uint64((1 << (hi - lo)) - 1)
+        chunk = (hashes >> np.uint64(lo)) & mask
+
+        order = np.argsort(chunk, kind="stable")
+        _, starts, counts = np.unique(chunk[order], return_index=True, return_counts=True)
+
+        for start, count in zip(starts[counts > 1], counts[counts > 1]):
+            members = order[start:start + count]
+            i, j = np.triu_indices(count, k=1)
+            a, b = members[i], members[j]
+            candidates.append(np.minimum(a, b).astype(np.int64) * n + np.maximum(a, b))
+
+    if not candidates:
+        return np.empty((0, 2), dtype=np.int64)
+
+    keys = np.unique(np.concatenate(candidates))
+    pairs = np.stack([keys // n, keys % n], axis=1)
+    close = hamming(hashes[pairs[:, 0]], hashes[pairs[:, 1]]) <= max_distance
+    return pairs[close]
+
+
+def cluster_pairs(n, pairs):
+    """Union-find over duplicate pairs → cluster id per image"""
+    parent = np.arange(n)
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    return np.array([find(i) for i in range(n)])
+
+
+# ------------------------------
+# Report + deduplicated manifests
+# ------------------------------
+def find_duplicates(data_dir=DATA_DIR, max_distance=MAX_DISTANCE, workers=None):
+    # Every image is read anyway, so the per-file stat check is nearly free
+    manifests = {split: get_manifest(os.path.join(data_dir, split), validate=True) for split in SPLITS
+                 if os.path.isdir(os.path.join(data_dir, split))}
+
+    rows = []
+    for split, manifest in manifests.items():
+        for index, (path, label) in enumerate(zip(manifest["paths"], manifest["labels"])):
+            rows.append((split, index, os.fsdecode(path), int(label)))
+    df = pd.DataFrame(rows, columns=["split", "index", "path", "label"])
+
+    full_paths = [os.path.join(data_dir, split, path) for split, path in zip(df["split"], df["path"])]
+    hashes = compute_hashes(full_paths, workers)
+    pairs = find_duplicate_pairs(hashes, max_distance)
+
+    df["hash"] = [f"{h:016x}" for h in hashes]
+    df["cluster"] = cluster_pairs(len(df), pairs)
+    return manifests, df, hashes, len(pairs)
+
+
+def summarize(df, num_pairs):
+    sizes = df.groupby("cluster")["path"].transform("size")
+    dup = df[sizes > 1]
+    clusters = dup.groupby("cluster")
+
+    cross_split = clusters["split"].nunique() > 1
+    label_conflict = clusters["label"].nunique() > 1
+
+    print("\n===== Duplicate Report =====")
+    print(f"Images: {len(df)}")
+    print(f"Near-duplicate pairs: {num_pairs}")
+    print(f"Duplicate clusters: {len(clusters)} ({len(dup)} images)")
+    if len(dup):
+        print(f"Largest cluster: {clusters.size().max()} images")
+    print(f"Clusters leaking across splits: {int(cross_split.sum())}")
+    print(f"Clusters with conflicting labels: {int(label_conflict.sum())}")
+
+    leaked = dup[dup["cluster"].isin(cross_split[cross_split].index)]
+    for split in SPLITS:
+        count = int((leaked["split"] == split).sum())
+        if count:
+            print(f"  {split}: {count} images in cross-split clusters")
+
+    if "kept" in df:
+        dropped = df[~df["kept"]]
+        same_split = dropped["duplicate_of"].str.split("/").str[0] == dropped["split"]
+        chained = (dup[dup["kept"]].groupby("cluster").size() > 1).sum()
+        print(f"Images dropped: {len(dropped)} ({int(same_split.sum())} duplicates within their own split)")
+        print(f"Chained clusters keeping more than one image: {int(chained)}")
+
+    return dup
+
+
+def keep_mask(df, hashes, max_distance=MAX_DISTANCE):
+    """
+    Greedy cover of each cluster in KEEP_PRIORITY order: keep the first remaining image, drop
+    the remaining ones within max_distance of it, repeat. Clusters are transitive (A~B, B~C with
+    A and C far apart), so a chained cluster keeps every image that is not itself a duplicate.
+    Returns (keep mask, position of the kept image each dropped one duplicates, -1 if kept)
+    """
+    priority = df["split"].map({split: i for i, split in enumerate(KEEP_PRIORITY)})
+    ranked = df.assign(priority=priority).sort_values(["cluster", "priority", "split", "index"])
+    sizes = ranked.groupby("cluster")["path"].transform("size")
+
+    keep = np.zeros(len(df), dtype=bool)
+    kept_as = np.full(len(df), -1)
+    keep[ranked.index[sizes == 1]] = True
+
+    for _, cluster in ranked[sizes > 1].groupby("cluster", sort=False):
+        remaining = cluster.index.to_numpy()
+        while len(remaining):
+            representative = remaining[0]
+            close = hamming(np.full(len(remaining), hashes[representative]), hashes[remaining]) <= max_distance
+            kept_as[remaining[close]] = representative
+            remaining = remaining[~close]
+            keep[representative] = True
+            kept_as[representative] = -1
+
+    return keep, kept_as
+
+
+def write_dedup_manifests(data_dir, manifests, df, keep):
+    """Filter each split's manifest to the kept images; RAOrdinalDataset loads it via manifest_name"""
+    for split, manifest in manifests.items():
+        in_split = (df["split"] == split).to_numpy()
+        kept_indices = np.sort(df.loc[in_split & keep, "index"].to_numpy())
+
+        filtered = {key: value[kept_indices] if key in ENTRY_KEYS else value
+                    for key, value in manifest.items() if key != "class_counts"}
+        filtered["class_counts"] = np.bincount(filtered["labels"], minlength=len(manifest["class_counts"]))
+
+        path = os.path.join(data_dir, split, DEDUP_MANIFEST_NAME)
+        save_manifest(filtered, path)
+        print(f"  {split}: kept {len(kept_indices)}/{len(manifest['labels'])} → {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find near-duplicate images across dataset splits")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE,
+                        help="Max Hamming distance between 64-bit hashes")
+    parser.add_argument("--workers", type=int, default=None, help="Decoder processes (default: CPU count)")
+    parser.add_argument("--report", default=REPORT_PATH, help="CSV listing every duplicate cluster")
+    args = parser.parse_args()
+
+    manifests, df, hashes, num_pairs = find_duplicates(args.data_dir, args.max_distance, args.workers)
+    keep, kept_as = keep_mask(df, hashes, args.max_distance)
+    df["kept"] = keep
+    df["duplicate_of"] = np.where(keep, "", (df["split"] + "/" + df["path"]).to_numpy()[kept_as])
+    dup = summarize(df, num_pairs)
+
+    dup.sort_values(["cluster", "split", "path"]).to_csv(args.report, index=False)
+    print(f"\nDuplicate clusters saved to {args.report}")
+
+    print("\nWriting deduplicated manifests:")
+    write_dedup_manifests(args.data_dir, manifests, df, keep)
@@ -21,6 +21,9 @@ NUM_CLASSES = 5
 BATCH_SIZE = 16
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 MODEL_PATH = "saved_models/efficientnet_ordinal.pth"
+MANIFEST = None  # e.g. "manifest_dedup.npz" written by dedup.py; None → full split
+REBUILD_MANIFEST = False   # re-walk the split folders instead of loading manifest.npz
+VALIDATE_MANIFEST = False  # also check every file's size/mtime (label folders are always checked)
 
 # ------------------------------
 # Test transforms
@@ -36,17 +39,31 @@ test_transform = transforms.Compose([
 # Load Test Dataset
 # ------------------------------
 def load_test_data():
-    test_set = RAOrdinalDataset(os.path.join(DATA_DIR, "test"), transform=test_transform)
+    test_set = RAOrdinalDataset(os.path.join(DATA_DIR, "test"), transform=test_transform,
+                                manifest_name=MANIFEST, rebuild_manifest=REBUILD_MANIFEST,
+                                validate_files=VALIDATE_MANIFEST)
     test_loader = DataLoader(test_set, batch_size=BATCH_SIZE, shuffle=False)
     return test_loader
 
+# ------------------------------
+# Metrics
+# ------------------------------
+def compute_metrics(all_labels, all_preds):
+    """Accuracy, QWK, MAE and macro F1 for integer label / prediction arrays"""
+    return {
+        "accuracy": float(np.mean(all_labels == all_preds)),
+        "qwk": float(cohen_kappa_score(all_labels, all_preds, weights="quadratic")),
+        "mae": float(mean_absolute_error(all_labels, all_preds)),
+        "f1": float(f1_score(all_labels, all_preds, average="macro")),
+    }
+
 # ------------------------------
 # Evaluation
 # ------------------------------
 def evaluate_model():
     test_loader = load_test_data()
 
-    model = EfficientNetOrdinal(NUM_CLASSES).to(DEVICE)
+    model = EfficientNetOrdinal(NUM_CLASSES, pretrained=False).to(DEVICE)
     model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
     model.eval()
 
@@ -70,16 +87,13 @@ def evaluate_model():
     # ------------------------------
     # Metrics
     # ------------------------------
-    accuracy = np.mean(all_labels == all_preds)
-    qwk = cohen_kappa_score(all_labels, all_preds, weights="quadratic")
-    mae = mean_absolute_error(all_labels, all_preds)
-    f1 = f1_score(all_labels, all_preds, average="macro")
+    metrics = compute_metrics(all_labels, all_preds)
 
     print("\n===== Evaluation Results =====")
-    print(f"Accuracy: {accuracy:.4f}")
-    print(f"QWK: {qwk:.4f}")
-    print(f"MAE: {mae:.4f}")
-    print(f"F1-Score (macro): {f1:.4f}")
+    print(f"Accuracy: {metrics['accuracy']:.4f}")
+    print(f"QWK: {metrics['qwk']:.4f}")
+    print(f"MAE: {metrics['mae']:.4f}")
+    print(f"F1-Score (macro): {metrics['f1']:.4f}")
 
     # ------------------------------
     # Confusion Matrix Plot
@@ -0,0 +1,50 @@
+import torch
+import torch.nn.functional as F
+
+
+# ------------------------------
+# Grad-CAM for the CORAL model
+# ------------------------------
+
+def coral_gradcam(model, images):
+    """
+    Grad-CAM on the last conv block of EfficientNetOrdinal.base, from a single
+    forward + backward pass that also yields the normal model outputs.
+
+    The explained score is the CORAL logit of the predicted threshold:
+    grade k > 0 → logit of P(y > k-1) (why the last threshold was passed),
+    grade 0     → negated logit of P(y > 0) (why the first one was not).
+
+    images: (B, 3, H, W) normalized tensor
+    Returns (outputs, cams): sigmoid outputs (B, K-1), heatmaps (B, H, W) in [0, 1]
+    """
+    base = model.base
+
+    # The backbone needs no graph: gradients are only taken w.r.t. its output,
+    # so autograd keeps just the pooling + head path instead of every intermediate
+    with torch.no_grad():
+        activations = base.features(images)
+
+    with torch.enable_grad():
+        # Same path as EfficientNet.forward, starting from the last conv block's activations
+        activations.requires_grad_()
+        pooled = torch.flatten(base.avgpool(activations), 1)
+        logits = model.ordinal_head.linear(base.classifier(pooled))
+        outputs = torch.sigmoid(logits)
+
+        grades = torch.sum(torch.round(outputs), dim=1).long()
+        threshold = (grades - 1).clamp(min=0)
+        sign = torch.where(grades > 0, 1.0, -1.0).to(logits.dtype)
+        target = (logits.gather(1, threshold.unsqueeze(1)).squeeze(1) * sign).sum()
+
+        # Gradient w.r.t. the activations only: backprop stops at the pooling layer
+        gradients, = torch.autograd.grad(target, activations)
+
+    weights = gradients.mean(dim=(2, 3), keepdim=True)
+    cams = F.relu((weights * activations).sum(dim=1, keepdim=True))
+    cams = F.interpolate(cams, size=images.shape[-2:], mode="bilinear", align_corners=False).squeeze(1)
+
+    cam_max = cams.flatten(1).max(dim=1).values.view(-1, 1, 1)
+    cams = cams / cam_max.clamp(min=1e-8)
+
+    return outputs.detach(), cams.detach()
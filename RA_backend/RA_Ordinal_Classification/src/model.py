@@ -1,11 +1,8 @@
 import ssl
-ssl._create_default_https_context = ssl._create_unverified_context
 
 import torch
 import torch.nn as nn
 from torchvision.models import efficientnet_b0, EfficientNet_B0_Weights
-import ssl
-ssl._create_default_https_context = ssl._create_unverified_context
 
 
 # ------------------------------
@@ -67,16 +64,33 @@ def coral_predict(outputs):
     return torch.sum(preds, dim=1).long()
 
 
+def coral_uncertain(outputs, margin):
+    """
+    Flag samples with any sigmoid output within `margin` of the 0.5 decision boundary.
+    Used by the inference cascade to decide which images need the full-resolution pass.
+    Example: margin=0.2, [0.95, 0.62, 0.1, 0.02] → True (0.62 is within 0.2 of 0.5)
+    """
+    return torch.any(torch.abs(outputs - 0.5) < margin, dim=1)
+
+
 # ------------------------------
 # Full Model: EfficientNet-B0 + CORAL head
 # ------------------------------
 
 class EfficientNetOrdinal(nn.Module):
-    def __init__(self, num_classes=5):
+    def __init__(self, num_classes=5, pretrained=True):
+        """
+        pretrained: start from ImageNet weights (for training). Pass False when a
+        trained checkpoint is loaded right after, to skip the weight download/load.
+        """
         super(EfficientNetOrdinal, self).__init__()
 
-        # Load EfficientNet-B0 pretrained on ImageNet
-        self.base = efficientnet_b0(weights=EfficientNet_B0_Weights.DEFAULT)
+        if pretrained:
+            # Weight download fails certificate checks on some machines
+            ssl._create_default_https_context = ssl._create_unverified_context
+
+        # Load EfficientNet-B0 (pretrained on ImageNet unless disabled)
+        self.base = efficientnet_b0(weights=EfficientNet_B0_Weights.DEFAULT if pretrained else None)
 
         # Extract number of features from last layer
         in_features = self.base.classifier[1].in_features
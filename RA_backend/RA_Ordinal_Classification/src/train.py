@@ -6,7 +6,7 @@ import os
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 
-from dataset import RAOrdinalDataset
+from dataset import RAOrdinalDataset, make_weighted_sampler
 from model import EfficientNetOrdinal, coral_loss
 
 # ------------------------------
@@ -19,6 +19,14 @@ EPOCHS = 10
 LR = 1e-4
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 MODEL_SAVE_PATH = "saved_models/efficientnet_ordinal.pth"
+MANIFEST = None  # e.g. "manifest_dedup.npz" written by dedup.py; None → full split
+REBUILD_MANIFEST = False   # re-walk the split folders instead of loading manifest.npz
+VALIDATE_MANIFEST = False  # also check every file's size/mtime (label folders are always checked)
+
+# Sampling: None → plain shuffle, "balanced" → equal draws per KL grade,
+# "weighted" → draws per grade proportional to GRADE_WEIGHTS
+SAMPLING = None
+GRADE_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 1.0]
 
 
 # ------------------------------
@@ -45,10 +53,22 @@ val_transform = transforms.Compose([
 # Load Datasets
 # ------------------------------
 def load_data():
-    train_set = RAOrdinalDataset(os.path.join(DATA_DIR, "train"), transform=train_transform)
-    val_set = RAOrdinalDataset(os.path.join(DATA_DIR, "val"), transform=val_transform)
-
-    train_loader = DataLoader(train_set, batch_size=BATCH_SIZE, shuffle=True)
+    train_set = RAOrdinalDataset(os.path.join(DATA_DIR, "train"), transform=train_transform,
+                                 manifest_name=MANIFEST, rebuild_manifest=REBUILD_MANIFEST,
+                                 validate_files=VALIDATE_MANIFEST)
+    val_set = RAOrdinalDataset(os.path.join(DATA_DIR, "val"), transform=val_transform,
+                               manifest_name=MANIFEST, rebuild_manifest=REBUILD_MANIFEST,
+                               validate_files=VALIDATE_MANIFEST)
+
+    if SAMPLING == "balanced":
+        sampler = make_weighted_sampler(train_set)
+    elif SAMPLING == "weighted":
+        sampler = make_weighted_sampler(train_set, grade_weights=GRADE_WEIGHTS)
+    else:
+        sampler = None
+
+    train_loader = DataLoader(train_set, batch_size=BATCH_SIZE,
+                              shuffle=sampler is None, sampler=sampler)
     val_loader = DataLoader(val_set, batch_size=BATCH_SIZE, shuffle=False)
 
     return train_loader, val_loader
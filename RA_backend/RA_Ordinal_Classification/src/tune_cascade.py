@@ -0,0 +1,155 @@
+import argparse
+import os
+import time
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+import torchvision.transforms as transforms
+
+from dataset import RAOrdinalDataset
+from model import EfficientNetOrdinal, coral_predict, coral_uncertain
+from evaluate import (compute_metrics, test_transform, DATA_DIR, NUM_CLASSES, BATCH_SIZE, DEVICE, MODEL_PATH,
+                      MANIFEST, REBUILD_MANIFEST, VALIDATE_MANIFEST)
+
+# ------------------------------
+# Config
+# ------------------------------
+LOW_RESOLUTION = 128
+FULL_RESOLUTION = 224
+MARGINS = np.round(np.arange(0.0, 0.51, 0.025), 3)
+
+
+def make_low_res_transform(resolution):
+    return transforms.Compose([
+        transforms.Resize((resolution, resolution)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406],
+                             [0.229, 0.224, 0.225])
+    ])
+
+
+def _sync():
+    if DEVICE == "cuda":
+        torch.cuda.synchronize()
+
+
+# ------------------------------
+# Collect low / full resolution outputs once
+# ------------------------------
+def collect_outputs(model, low_resolution, split):
+    """
+    Run a dataset split through the model at both resolutions.
+    Returns labels, low-res outputs, full-res outputs and the time spent in each pass.
+    """
+    low_transform = make_low_res_transform(low_resolution)
+    split_set = RAOrdinalDataset(os.path.join(DATA_DIR, split),
+                                 transform=lambda img: (low_transform(img), test_transform(img)),
+                                 manifest_name=MANIFEST, rebuild_manifest=REBUILD_MANIFEST,
+                                 validate_files=VALIDATE_MANIFEST)
+    split_loader = DataLoader(split_set, batch_size=BATCH_SIZE, shuffle=False)
+
+    all_labels, low_outputs, full_outputs = [], [], []
+    low_time, full_time = 0.0, 0.0
+
+    with torch.no_grad():
+        for (low_images, full_images), labels in split_loader:
+            low_images, full_images = low_images.to(DEVICE), full_images.to(DEVICE)
+
+            _sync()
+            start = time.perf_counter()
+            low_outputs.append(model(low_images).cpu())
+            _sync()
+            low_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            full_outputs.append(model(full_images).cpu())
+            _sync()
+            full_time += time.perf_counter() - start
+
+            all_labels.extend(labels.numpy())
+
+    return np.array(all_labels), torch.cat(low_outputs), torch.cat(full_outputs), low_time, full_time
+
+
+# ------------------------------
+# Margin sweep
+# ------------------------------
+def sweep_margins(labels, low_outputs, full_outputs, cost_ratio, margins=MARGINS):
+    """
+    Simulate the cascade for every margin.
+    cost_ratio: cost of a low-res pass relative to a full-res pass
+    """
+    rows = []
+    for margin in margins:
+        escalate = coral_uncertain(low_outputs, margin)
+        outputs = torch.where(escalate.unsqueeze(1), full_outputs, low_outputs)
+        preds = coral_predict(outputs).numpy()
+
+        escalation_rate = float(escalate.float().mean())
+        relative_cost = cost_ratio + escalation_rate  # every image pays the low-res pass
+        row = compute_metrics(labels, preds)
+        row.update({
+            "margin": float(margin),
+            "escalation_rate": escalation_rate,
+            "compute_saved": 1.0 - relative_cost,
+        })
+        rows.append(row)
+    return rows
+
+
+def tune_cascade(low_resolution=LOW_RESOLUTION, qwk_target=None):
+    model = EfficientNetOrdinal(NUM_CLASSES, pretrained=False).to(DEVICE)
+    model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
+    model.eval()
+
+    # The margin is a deployed hyperparameter: tune it on val, keep test held out
+    labels, low_outputs, full_outputs, low_time, full_time = collect_outputs(model, low_resolution, "val")
+
+    full_metrics = compute_metrics(labels, coral_predict(full_outputs).numpy())
+    pixel_ratio = (low_resolution / FULL_RESOLUTION) ** 2
+    measured_ratio = low_time / full_time
+
+    if qwk_target is None:
+        qwk_target = full_metrics["qwk"]  # default: no loss vs. full resolution
+
+    print("\n===== Full Resolution Baseline (val) =====")
+    print(f"QWK: {full_metrics['qwk']:.4f} | Accuracy: {full_metrics['accuracy']:.4f} | MAE: {full_metrics['mae']:.4f}")
+    print(f"Low-res pass cost: {measured_ratio:.3f} of full (measured), {pixel_ratio:.3f} (pixels)")
+
+    rows = sweep_margins(labels, low_outputs, full_outputs, measured_ratio)
+
+    print(f"\n===== Cascade Sweep on val ({low_resolution}px → {FULL_RESOLUTION}px) =====")
+    print(f"{'margin':>8}{'QWK':>8}{'Acc':>8}{'MAE':>8}{'F1':>8}{'escalated':>11}{'saved':>8}")
+    for row in rows:
+        print(f"{row['margin']:>8.3f}{row['qwk']:>8.4f}{row['accuracy']:>8.4f}{row['mae']:>8.4f}"
+              f"{row['f1']:>8.4f}{row['escalation_rate'] * 100:>10.1f}%{row['compute_saved'] * 100:>7.1f}%")
+
+    # Margins are swept ascending, so the first one meeting the target escalates the least
+    chosen = next((row for row in rows if row["qwk"] >= qwk_target), None)
+    if chosen is None:
+        print(f"\nNo margin reaches QWK {qwk_target:.4f}; keep the cascade disabled.")
+        return None
+
+    print(f"\nRecommended margin for val QWK >= {qwk_target:.4f}: {chosen['margin']:.3f}")
+    print(f"  val:  QWK {chosen['qwk']:.4f}, {chosen['escalation_rate'] * 100:.1f}% escalated, "
+          f"{chosen['compute_saved'] * 100:.1f}% compute saved")
+
+    # Held-out check of the chosen margin only
+    labels, low_outputs, full_outputs, low_time, full_time = collect_outputs(model, low_resolution, "test")
+    test_full_qwk = compute_metrics(labels, coral_predict(full_outputs).numpy())["qwk"]
+    test_row = sweep_margins(labels, low_outputs, full_outputs, low_time / full_time, margins=[chosen["margin"]])[0]
+    print(f"  test: QWK {test_row['qwk']:.4f} (full resolution {test_full_qwk:.4f}), "
+          f"{test_row['escalation_rate'] * 100:.1f}% escalated, {test_row['compute_saved'] * 100:.1f}% compute saved")
+    print(f"  Serve with: CASCADE_ENABLED=1 CASCADE_RESOLUTION={low_resolution} CASCADE_MARGIN={chosen['margin']}")
+    return chosen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick the CORAL cascade margin for a QWK target")
+    parser.add_argument("--low-resolution", type=int, default=LOW_RESOLUTION,
+                        help="Resolution of the cheap first pass")
+    parser.add_argument("--qwk-target", type=float, default=None,
+                        help="Minimum val QWK (default: full-resolution val QWK)")
+    args = parser.parse_args()
+
+    tune_cascade(args.low_resolution, args.qwk_target)
@@ -1,116 +1,220 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, Response, request, jsonify
 from flask_cors import CORS
-import torch
-import torchvision.transforms as transforms
-import numpy as np
-from PIL import Image
-import io
+import hmac
+import importlib
+import importlib.abc
 import os
 import sys
-
-# Add RA_Ordinal_Classification src to path
-project_root = os.path.dirname(os.path.abspath(__file__))
-src_path = os.path.join(project_root, 'RA_Ordinal_Classification', 'src')
-if src_path not in sys.path:
-    sys.path.insert(0, src_path)
-
-try:
-    from model import EfficientNetOrdinal, coral_predict
-except ImportError as e:
-    print(f"❌ Import error: {e}")
-    print(f"📁 Current directory: {os.getcwd()}")
-    print(f"📁 Project root: {project_root}")
-    print(f"📁 Src path: {src_path}")
-    print(f"📁 Src path exists: {os.path.exists(src_path)}")
-    
-    # List files in src directory
-    if os.path.exists(src_path):
-        print(f"📁 Files in src: {os.listdir(src_path)}")
-    
-    # List files in RA_Ordinal_Classification
-    ra_path = os.path.join(project_root, 'RA_Ordinal_Classification')
-    if os.path.exists(ra_path):
-        print(f"📁 Files in RA_Ordinal_Classification: {os.listdir(ra_path)}")
-    
-    print(f"📁 Sys path: {sys.path}")
-    raise
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for React frontend
+import threading
+import time
 
 # Configuration
-CORAL_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'RA_Ordinal_Classification', 'efficientnet_ordinal.pth')
-NUM_CLASSES = 5
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-
-# ==================== CORAL Model (PyTorch EfficientNet-B0) ====================
-try:
-    coral_model = EfficientNetOrdinal(num_classes=NUM_CLASSES).to(DEVICE)
-    coral_model.load_state_dict(torch.load(CORAL_MODEL_PATH, map_location=DEVICE))
-    coral_model.eval()
-    print(f"✅ CORAL PyTorch model loaded successfully from {CORAL_MODEL_PATH}")
-    print(f"📱 Using device: {DEVICE}")
-except Exception as e:
-    print(f"❌ Error loading CORAL model: {e}")
-    coral_model = None
-
-# PyTorch Image preprocessing transform (for CORAL model)
-pytorch_transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
-
-# Class definitions - Kellgren-Lawrence Osteoarthritis Grades
-STAGE_DESCRIPTIONS = {
-    0: {
-        "severity": "Normal",
-        "explanation": "No signs of osteoarthritis detected. Joint spaces appear normal with no significant abnormalities such as osteophytes, joint space narrowing, or subchondral sclerosis."
-    },
-    1: {
-        "severity": "Doubtful/Minimal",
-        "explanation": "Minimal changes detected. Possible early signs of minute osteophytes with doubtful significance. Regular monitoring recommended to track progression."
-    },
-    2: {
-        "severity": "Mild",
-        "explanation": "Mild osteoarthritis detected. Definite osteophytes present with possible joint space narrowing."
-    },
-    3: {
-        "severity": "Moderate",
-        "explanation": "Moderate osteoarthritis detected. Multiple osteophytes, definite joint space narrowing, some sclerosis, and possible deformity of bone ends."
-    },
-    4: {
-        "severity": "Severe",
-        "explanation": "Severe osteoarthritis detected. Large osteophytes, marked joint space narrowing, severe sclerosis, and definite bone end deformity."
-    }
+BINARY_API_TOKEN = os.environ.get('BINARY_API_TOKEN')  # shared secret; /predict/binary is disabled without it
+BINARY_MAX_BATCH = int(os.environ.get('BINARY_MAX_BATCH', 32))
+# "eager": load the model inside create_app()
+# "background": answer /health and / immediately, load the model in a background thread
+# "manual": the caller runs initialize() itself (e.g. tests that never touch the model)
+MODEL_LOAD_MODE = os.environ.get('MODEL_LOAD_MODE', 'eager')
+
+# Heavy modules imported by initialize(), timed one by one for the startup report.
+# Each entry is the incremental cost: modules already pulled in by an earlier entry are free.
+STARTUP_IMPORTS = ['numpy', 'PIL.Image', 'torch', 'torchvision', 'inference']
+# Slowest modules (by self time, like -X importtime) listed in the startup report
+STARTUP_REPORT_TOP_N = 20
+
+# Set by initialize(); the inference module is only imported once the model is requested
+inference = None
+startup_state = {
+    'status': 'not_started',  # not_started → loading → ready | failed
+    'report': None
 }
+_init_lock = threading.Lock()
 
+api = Blueprint('api', __name__)
 
-def preprocess_image_pytorch(image_file):
+
+class _TimedLoader:
     """
-    Preprocess the uploaded image for PyTorch CORAL model prediction
+    Wraps a module loader to time create_module + exec_module (extension modules load in
+    create_module). Afterwards the spec points back at the real loader; the module object
+    itself is never touched, since some modules (e.g. torch's config modules) reject setattr.
     """
-    try:
-        # Read image
-        img = Image.open(image_file).convert('RGB')
-        
-        # Apply transforms (resize, normalize)
-        img_tensor = pytorch_transform(img)
-        
-        # Add batch dimension
-        img_batch = img_tensor.unsqueeze(0)
-        
-        return img_batch
-    except Exception as e:
-        raise ValueError(f"Error processing image: {str(e)}")
+
+    def __init__(self, loader, name, timer):
+        self._loader = loader
+        self._name = name
+        self._timer = timer
+        self._start = None
+        self._spec = None
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        self._spec = spec
+        self._timer.stack.append(0.0)  # time spent in nested imports
+        self._start = time.perf_counter()
+        create = getattr(self._loader, 'create_module', None)
+        try:
+            return create(spec) if create is not None else None
+        except BaseException:
+            self._finish()
+            raise
+
+    def exec_module(self, module):
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._finish()
+            if module.__dict__.get('__loader__') is self:
+                module.__dict__['__loader__'] = self._loader
+
+    def _finish(self):
+        if self._spec is not None:
+            self._spec.loader = self._loader
+        if self._start is None:
+            return
+        elapsed = time.perf_counter() - self._start
+        self._start = None
+        stack = self._timer.stack
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        self._timer.timings[self._name] = (elapsed - children, elapsed)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Temporary sys.meta_path finder recording self and cumulative import time per module,
+    like `python -X importtime`. Only imports made by the installing thread are timed.
+    """
+
+    def __init__(self):
+        self.timings = {}  # module name → (self seconds, cumulative seconds)
+        self.stack = []
+        self.thread_id = threading.get_ident()
+
+    def find_spec(self, fullname, path, target=None):
+        if threading.get_ident() != self.thread_id:
+            return None
+
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, fullname, self)
+        return spec
+
+    def __enter__(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc):
+        sys.meta_path.remove(self)
+
+    def top(self, n):
+        rows = sorted(self.timings.items(), key=lambda item: item[1][0], reverse=True)[:n]
+        return [{'module': name, 'self_ms': round(self_s * 1000, 1), 'cumulative_ms': round(cum_s * 1000, 1)}
+                for name, (self_s, cum_s) in rows]
+
+
+def initialize():
+    """
+    Import torch & co. and load the CORAL model, recording a per-step startup report
+    Safe to call more than once; later calls return the existing report
+    """
+    global inference
+
+    with _init_lock:
+        if startup_state['status'] in ('ready', 'failed'):
+            return startup_state['report']
+        startup_state['status'] = 'loading'
+
+        report = {'imports_ms': {}}
+        start = time.perf_counter()
+
+        try:
+            with ImportTimer() as timer:
+                try:
+                    for name in STARTUP_IMPORTS:
+                        t = time.perf_counter()
+                        importlib.import_module(name)
+                        report['imports_ms'][name] = round((time.perf_counter() - t) * 1000, 1)
+                finally:
+                    report['modules_imported'] = len(timer.timings)
+                    report['slowest_imports'] = timer.top(STARTUP_REPORT_TOP_N)
+
+            module = importlib.import_module('inference')  # already loaded above
+            t = time.perf_counter()
+            module.load_model()
+            report['model_load_ms'] = round((time.perf_counter() - t) * 1000, 1)
+            report['device'] = module.DEVICE
+
+            inference = module
+            if module.coral_model is not None:
+                startup_state['status'] = 'ready'
+            else:
+                report['error'] = module.load_error
+                startup_state['status'] = 'failed'
+        except Exception as e:
+            print(f"❌ Error during initialization: {e}")
+            report['error'] = str(e)
+            startup_state['status'] = 'failed'
+
+        report['total_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        startup_state['report'] = report
+        print_startup_report(report)
+        return report
+
+
+def print_startup_report(report):
+    print("⏱️  Startup report:")
+    for name, ms in report['imports_ms'].items():
+        print(f"   import {name:<14}{ms:>10.1f} ms")
+    if 'model_load_ms' in report:
+        print(f"   model load          {report['model_load_ms']:>10.1f} ms")
+    print(f"   total               {report['total_ms']:>10.1f} ms")
+    if report.get('slowest_imports'):
+        print(f"   slowest of {report['modules_imported']} modules imported (self / cumulative ms):")
+        for row in report['slowest_imports'][:10]:
+            print(f"     {row['module']:<40}{row['self_ms']:>10.1f}{row['cumulative_ms']:>12.1f}")
+    if report.get('error'):
+        print(f"   error: {report['error']}")
 
 
-@app.route('/health', methods=['GET'])
+def model_unavailable():
+    """Error response while the model is loading or failed to load, else None"""
+    if startup_state['status'] == 'not_started':
+        return jsonify({'error': 'CORAL model not initialized. Call initialize() first.'}), 503
+    if startup_state['status'] == 'loading':
+        return jsonify({'error': 'CORAL model is still loading. Please retry shortly.'}), 503
+    if inference is None or inference.coral_model is None:
+        return jsonify({'error': 'CORAL model not loaded. Please check server logs.'}), 500
+    return None
+
+
+@api.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'coral_model_loaded': coral_model is not None
+        'coral_model_loaded': startup_state['status'] == 'ready',
+        'model_status': startup_state['status']
+    }), 200
+
+
+@api.route('/startup', methods=['GET'])
+def startup_report():
+    """Import and model-load timings recorded by initialize()"""
+    return jsonify({
+        'model_status': startup_state['status'],
+        'report': startup_state['report']
     }), 200
 
 
@@ -118,81 +222,41 @@ def validate_file(request):
     """Common file validation logic"""
     if 'file' not in request.files:
         return None, {'error': 'No file provided. Please upload an image.'}, 400
-    
+
     file = request.files['file']
-    
+
     if file.filename == '':
         return None, {'error': 'Empty file provided.'}, 400
-    
+
     allowed_extensions = {'.png', '.jpg', '.jpeg'}
     file_ext = os.path.splitext(file.filename)[1].lower()
     if file_ext not in allowed_extensions:
         return None, {'error': f'Invalid file type. Allowed types: {", ".join(allowed_extensions)}'}, 400
-    
+
     return file, None, None
 
 
-def predict_coral(file):
-    """Make prediction using CORAL ordinal regression model"""
-    if coral_model is None:
-        raise Exception("CORAL model not loaded")
-    
-    # Preprocess image
-    file.seek(0)  # Reset file pointer
-    img_tensor = preprocess_image_pytorch(file)
-    img_tensor = img_tensor.to(DEVICE)
-
-    # Make prediction (no gradient needed for inference)
-    with torch.no_grad():
-        outputs = coral_model(img_tensor)
-        predicted_class_tensor = coral_predict(outputs)
-        predicted_class = int(predicted_class_tensor[0].item())
-        
-        sigmoid_outputs = outputs[0].cpu().numpy()
-        
-        # Convert CORAL ordinal outputs to class probabilities
-        class_probs = np.zeros(NUM_CLASSES)
-        class_probs[0] = 1.0 - sigmoid_outputs[0]
-        for i in range(1, NUM_CLASSES - 1):
-            class_probs[i] = sigmoid_outputs[i-1] - sigmoid_outputs[i]
-        class_probs[NUM_CLASSES - 1] = sigmoid_outputs[NUM_CLASSES - 2]
-        
-        confidence = float(class_probs[predicted_class])
-    
-    stage_info = STAGE_DESCRIPTIONS.get(predicted_class, {
-        "severity": "Unknown",
-        "explanation": "Unable to determine severity."
-    })
-    
-    return {
-        'grade': predicted_class,
-        'severity': stage_info['severity'],
-        'confidence': round(confidence * 100, 2),
-        'explanation': stage_info['explanation'],
-        'probabilities': {f"grade_{i}": float(class_probs[i]) for i in range(NUM_CLASSES)},
-        'model_type': 'CORAL Ordinal Regression (EfficientNet-B0)',
-        'model_description': 'Uses ordinal regression with CORAL loss to predict ordered KL grades. Leverages the ordinal nature of severity levels for more consistent predictions.',
-        'ordinal_outputs': sigmoid_outputs.tolist()
-    }
-
-
-@app.route('/predict', methods=['POST'])
-@app.route('/predict/coral', methods=['POST'])
+@api.route('/predict', methods=['POST'])
+@api.route('/predict/coral', methods=['POST'])
 def predict_coral_endpoint():
     """
     CORAL model prediction endpoint
     Expects: multipart/form-data with 'file' field containing the image
+             optional 'explain=true' (form field or query string) for a Grad-CAM overlay
     Returns: JSON with CORAL model prediction results
     """
-    if coral_model is None:
-        return jsonify({'error': 'CORAL model not loaded. Please check server logs.'}), 500
+    unavailable = model_unavailable()
+    if unavailable:
+        return unavailable
 
     file, error, status = validate_file(request)
     if error:
         return jsonify(error), status
 
+    explain = request.values.get('explain', '').lower() in ('1', 'true', 'yes')
+
     try:
-        result = predict_coral(file)
+        result = inference.predict_coral(file, explain=explain)
         return jsonify(result), 200
     except ValueError as ve:
         return jsonify({'error': str(ve)}), 400
@@ -201,7 +265,43 @@ def predict_coral_endpoint():
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
 
-@app.route('/', methods=['GET'])
+@api.route('/predict/binary', methods=['POST'])
+def predict_binary_endpoint():
+    """
+    Binary CORAL prediction endpoint for trusted internal clients
+    Expects: application/octet-stream body in the layout described in binary_protocol.py
+    Returns: binary grades, ordinal outputs and class probabilities (no static text)
+    """
+    if not BINARY_API_TOKEN:
+        return jsonify({'error': 'Binary endpoint disabled. Set BINARY_API_TOKEN on the server.'}), 403
+
+    token = request.headers.get('X-API-Token', '')
+    if not hmac.compare_digest(token.encode(), BINARY_API_TOKEN.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    unavailable = model_unavailable()
+    if unavailable:
+        return unavailable
+
+    # Reject oversized bodies before reading them
+    if request.content_length is None:
+        return jsonify({'error': 'Content-Length required'}), 411
+    max_size = inference.binary_protocol.max_request_size(BINARY_MAX_BATCH)
+    if request.content_length > max_size:
+        return jsonify({'error': f'Request body exceeds {max_size} bytes'}), 413
+
+    try:
+        body = inference.predict_binary(request.get_data(), max_batch=BINARY_MAX_BATCH)
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+    except Exception as e:
+        print(f"Error during binary CORAL prediction: {str(e)}")
+        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+
+    return Response(body, status=200, mimetype=inference.binary_protocol.CONTENT_TYPE)
+
+
+@api.route('/', methods=['GET'])
 def index():
     """Root endpoint"""
     return jsonify({
@@ -210,16 +310,43 @@ def index():
         'model': 'EfficientNet-B0 with CORAL Ordinal Regression',
         'endpoints': {
             '/health': 'GET - Health check',
-            '/predict': 'POST - CORAL model prediction',
-            '/predict/coral': 'POST - CORAL model prediction (alias)'
+            '/startup': 'GET - Startup import/model-load timings',
+            '/predict': 'POST - CORAL model prediction (explain=true adds a Grad-CAM overlay)',
+            '/predict/coral': 'POST - CORAL model prediction (alias)',
+            '/predict/binary': 'POST - CORAL batch prediction, binary protocol (internal clients)'
         }
     }), 200
 
 
+def create_app(mode=None):
+    """
+    Application factory
+    mode: "eager", "background" or "manual" (default: MODEL_LOAD_MODE env var)
+    """
+    mode = mode or MODEL_LOAD_MODE
+    if mode not in ('eager', 'background', 'manual'):
+        raise ValueError(f"Unknown model load mode: {mode}")
+
+    app = Flask(__name__)
+    CORS(app)  # Enable CORS for React frontend
+    app.register_blueprint(api)
+
+    if mode == 'eager':
+        initialize()
+    elif mode == 'background':
+        threading.Thread(target=initialize, name='model-init', daemon=True).start()
+
+    return app
+
+
 if __name__ == '__main__':
     # Run the Flask app
     port = int(os.environ.get('PORT', 5000))
     print("🚀 Starting Osteoarthritis Detection API Server...")
-    print(f"📁 CORAL model path: {CORAL_MODEL_PATH}")
     print(f"🌐 Port: {port}")
+    if '--check' in sys.argv[1:]:
+        # Smoke check: run the real initialize() and fail unless the model is ready
+        initialize()
+        sys.exit(0 if startup_state['status'] == 'ready' else 1)
+    app = create_app()
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,161 @@
+"""
+Compact binary protocol for the /predict/binary endpoint
+Intended for trusted internal clients that already hold decoded, resized images.
+
+All fields are little-endian.
+
+Request:
+    header  <4s B B H H H H>  magic b"RAQ1", dtype, layout, batch, channels, height, width
+            channels must be 3 and height/width must match the model input (224x224)
+    payload raw tensor bytes
+        DTYPE_UINT8   + LAYOUT_NHWC: raw RGB pixels (0-255), normalized on the server
+        DTYPE_FLOAT32 + LAYOUT_NCHW: already ImageNet-normalized tensor, used as-is
+
+Response:
+    header  <4s H H>  magic b"RAR1", batch, num_classes
+    grades          int32   (batch,)
+    ordinal_outputs float32 (batch, num_classes - 1)
+    probabilities   float32 (batch, num_classes)
+"""
+
+import struct
+import numpy as np
+
+REQUEST_MAGIC = b"RAQ1"
+RESPONSE_MAGIC = b"RAR1"
+REQUEST_HEADER = struct.Struct("<4sBBHHHH")
+RESPONSE_HEADER = struct.Struct("<4sHH")
+CONTENT_TYPE = "application/octet-stream"
+INPUT_SIZE = 224  # model input resolution; the server does not resize binary payloads
+
+DTYPE_UINT8 = 0
+DTYPE_FLOAT32 = 1
+LAYOUT_NHWC = 0
+LAYOUT_NCHW = 1
+
+_NUMPY_DTYPES = {DTYPE_UINT8: np.dtype("<u1"), DTYPE_FLOAT32: np.dtype("<f4")}
+
+
+def encode_request(images):
+    """
+    Pack a batch of images into a request body
+    images: uint8 array (N, H, W, 3) / (H, W, 3), or normalized float32 array (N, 3, H, W) / (3, H, W)
+    """
+    images = np.asarray(images)
+
+    if images.dtype == np.uint8:
+        dtype_code, layout = DTYPE_UINT8, LAYOUT_NHWC
+    elif images.dtype in (np.float32, np.float64):
+        dtype_code, layout = DTYPE_FLOAT32, LAYOUT_NCHW
+    else:
+        raise ValueError(f"Unsupported dtype: {images.dtype}")
+
+    if images.ndim == 3:
+        images = images[np.newaxis]
+    if images.ndim != 4:
+        raise ValueError(f"Expected a 3D or 4D array, got shape {images.shape}")
+
+    if layout == LAYOUT_NHWC:
+        batch, height, width, channels = images.shape
+    else:
+        batch, channels, height, width = images.shape
+
+    header = REQUEST_HEADER.pack(REQUEST_MAGIC, dtype_code, layout, batch, channels, height, width)
+    payload = np.ascontiguousarray(images, dtype=_NUMPY_DTYPES[dtype_code]).tobytes()
+    return header + payload
+
+
+def max_request_size(max_batch, input_size=INPUT_SIZE):
+    """Largest valid request body: max_batch float32 images plus the header"""
+    return REQUEST_HEADER.size + max_batch * 3 * input_size * input_size * _NUMPY_DTYPES[DTYPE_FLOAT32].itemsize
+
+
+def decode_request(body, max_batch=None, input_size=INPUT_SIZE):
+    """
+    Unpack a request body into (array, layout)
+    Raises ValueError for malformed requests
+    """
+    if len(body) < REQUEST_HEADER.size:
+        raise ValueError("Request body too short")
+
+    magic, dtype_code, layout, batch, channels, height, width = REQUEST_HEADER.unpack_from(body)
+    if magic != REQUEST_MAGIC:
+        raise ValueError("Invalid request magic")
+    if dtype_code not in _NUMPY_DTYPES:
+        raise ValueError(f"Unsupported dtype code: {dtype_code}")
+    if (dtype_code, layout) not in ((DTYPE_UINT8, LAYOUT_NHWC), (DTYPE_FLOAT32, LAYOUT_NCHW)):
+        raise ValueError("Supported inputs are uint8 NHWC or float32 NCHW")
+    if batch == 0:
+        raise ValueError("Empty batch")
+    if max_batch is not None and batch > max_batch:
+        raise ValueError(f"Batch size {batch} exceeds limit of {max_batch}")
+    if channels != 3:
+        raise ValueError(f"Expected 3 channels, got {channels}")
+    if (height, width) != (input_size, input_size):
+        raise ValueError(f"Expected {input_size}x{input_size} images, got {height}x{width}")
+
+    if layout == LAYOUT_NHWC:
+        shape = (batch, height, width, channels)
+    else:
+        shape = (batch, channels, height, width)
+
+    dtype = _NUMPY_DTYPES[dtype_code]
+    expected = REQUEST_HEADER.size + int(np.prod(shape)) * dtype.itemsize
+    if len(body) != expected:
+        raise ValueError(f"Expected {expected} bytes for shape {shape}, got {len(body)}")
+
+    array = np.frombuffer(body, dtype=dtype, offset=REQUEST_HEADER.size).reshape(shape)
+    return array, layout
+
+
+def encode_response(grades, ordinal_outputs, probabilities):
+    """Pack batched predictions into a response body"""
+    grades = np.asarray(grades, dtype="<i4")
+    batch, num_classes = np.shape(probabilities)
+
+    return b"".join([
+        RESPONSE_HEADER.pack(RESPONSE_MAGIC, batch, num_classes),
+        grades.tobytes(),
+        np.asarray(ordinal_outputs, dtype="<f4").tobytes(),
+        np.asarray(probabilities, dtype="<f4").tobytes(),
+    ])
+
+
+def decode_response(body):
+    """
+    Unpack a response body
+    Returns dict with 'grades', 'ordinal_outputs' and 'probabilities' arrays
+    """
+    magic, batch, num_classes = RESPONSE_HEADER.unpack_from(body)
+    if magic != RESPONSE_MAGIC:
+        raise ValueError("Invalid response magic")
+
+    offset = RESPONSE_HEADER.size
+    grades = np.frombuffer(body, dtype="<i4", count=batch, offset=offset)
+    offset += grades.nbytes
+    ordinal_outputs = np.frombuffer(body, dtype="<f4", count=batch * (num_classes - 1), offset=offset)
+    offset += ordinal_outputs.nbytes
+    probabilities = np.frombuffer(body, dtype="<f4", count=batch * num_classes, offset=offset)
+
+    return {
+        'grades': grades,
+        'ordinal_outputs': ordinal_outputs.reshape(batch, num_classes - 1),
+        'probabilities': probabilities.reshape(batch, num_classes),
+    }
+
+
+def predict_binary(base_url, images, token=None, timeout=30):
+    """
+    Client helper: send images to /predict/binary and return the decoded response
+    images: see encode_request
+    """
+    import requests
+
+    headers = {'Content-Type': CONTENT_TYPE}
+    if token:
+        headers['X-API-Token'] = token
+
+    response = requests.post(f"{base_url}/predict/binary", data=encode_request(images),
+                             headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return decode_response(response.content)
@@ -0,0 +1,340 @@
+"""
+CORAL model inference for the RA Detection Backend API
+Holds everything that needs torch/torchvision/numpy/PIL, so app.py can import
+this module (and pay for those imports) only when the model is initialized.
+"""
+
+import torch
+import torchvision.transforms as transforms
+import numpy as np
+from PIL import Image
+import io
+import os
+import sys
+import base64
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+import binary_protocol
+
+# Add RA_Ordinal_Classification src to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(project_root, 'RA_Ordinal_Classification', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+try:
+    from model import EfficientNetOrdinal, coral_predict, coral_uncertain
+    from gradcam import coral_gradcam
+except ImportError as e:
+    print(f"❌ Import error: {e}")
+    print(f"📁 Current directory: {os.getcwd()}")
+    print(f"📁 Project root: {project_root}")
+    print(f"📁 Src path: {src_path}")
+    print(f"📁 Src path exists: {os.path.exists(src_path)}")
+
+    # List files in src directory
+    if os.path.exists(src_path):
+        print(f"📁 Files in src: {os.listdir(src_path)}")
+
+    # List files in RA_Ordinal_Classification
+    ra_path = os.path.join(project_root, 'RA_Ordinal_Classification')
+    if os.path.exists(ra_path):
+        print(f"📁 Files in RA_Ordinal_Classification: {os.listdir(ra_path)}")
+
+    print(f"📁 Sys path: {sys.path}")
+    raise
+
+# Configuration
+CORAL_MODEL_PATH = os.path.join(project_root, 'RA_Ordinal_Classification', 'efficientnet_ordinal.pth')
+NUM_CLASSES = 5
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+GRADCAM_CACHE_SIZE = int(os.environ.get('GRADCAM_CACHE_SIZE', 256))  # explained images kept in memory
+GRADCAM_ALPHA = 0.4  # heatmap opacity in the overlay
+# Inference cascade: cheap low-res pass first, full 224x224 pass only for uncertain images
+# (pick the margin with RA_Ordinal_Classification/src/tune_cascade.py)
+CASCADE_ENABLED = os.environ.get('CASCADE_ENABLED', '0').lower() in ('1', 'true', 'yes')
+CASCADE_RESOLUTION = int(os.environ.get('CASCADE_RESOLUTION', 128))
+CASCADE_MARGIN = float(os.environ.get('CASCADE_MARGIN', 0.2))
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# Set by load_model()
+coral_model = None
+load_error = None
+
+# PyTorch Image preprocessing transform (for CORAL model)
+pytorch_transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+])
+
+# Low-resolution transform for the first stage of the cascade
+cascade_transform = transforms.Compose([
+    transforms.Resize((CASCADE_RESOLUTION, CASCADE_RESOLUTION)),
+    transforms.ToTensor(),
+    transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+])
+
+# Same normalization as pytorch_transform, for tensors decoded from the binary protocol
+_mean_tensor = torch.tensor(IMAGENET_MEAN, device=DEVICE).view(1, 3, 1, 1)
+_std_tensor = torch.tensor(IMAGENET_STD, device=DEVICE).view(1, 3, 1, 1)
+
+# Class definitions - Kellgren-Lawrence Osteoarthritis Grades
+STAGE_DESCRIPTIONS = {
+    0: {
+        "severity": "Normal",
+        "explanation": "No signs of osteoarthritis detected. Joint spaces appear normal with no significant abnormalities such as osteophytes, joint space narrowing, or subchondral sclerosis."
+    },
+    1: {
+        "severity": "Doubtful/Minimal",
+        "explanation": "Minimal changes detected. Possible early signs of minute osteophytes with doubtful significance. Regular monitoring recommended to track progression."
+    },
+    2: {
+        "severity": "Mild",
+        "explanation": "Mild osteoarthritis detected. Definite osteophytes present with possible joint space narrowing."
+    },
+    3: {
+        "severity": "Moderate",
+        "explanation": "Moderate osteoarthritis detected. Multiple osteophytes, definite joint space narrowing, some sclerosis, and possible deformity of bone ends."
+    },
+    4: {
+        "severity": "Severe",
+        "explanation": "Severe osteoarthritis detected. Large osteophytes, marked joint space narrowing, severe sclerosis, and definite bone end deformity."
+    }
+}
+
+
+# ==================== CORAL Model (PyTorch EfficientNet-B0) ====================
+def load_model():
+    """
+    Build the CORAL model and load the trained weights
+    ImageNet weights are not downloaded since the checkpoint replaces them anyway
+    """
+    global coral_model, load_error
+    try:
+        model = EfficientNetOrdinal(num_classes=NUM_CLASSES, pretrained=False).to(DEVICE)
+        model.load_state_dict(torch.load(CORAL_MODEL_PATH, map_location=DEVICE))
+        model.eval()
+        coral_model = model
+        load_error = None
+        print(f"✅ CORAL PyTorch model loaded successfully from {CORAL_MODEL_PATH}")
+        print(f"📱 Using device: {DEVICE}")
+    except Exception as e:
+        print(f"❌ Error loading CORAL model: {e}")
+        coral_model = None
+        load_error = f"Error loading CORAL model: {e}"
+    return coral_model
+
+
+def load_image(image_file):
+    """
+    Decode the uploaded image to RGB
+    """
+    try:
+        return Image.open(image_file).convert('RGB')
+    except Exception as e:
+        raise ValueError(f"Error processing image: {str(e)}")
+
+
+def preprocess_image_pytorch(image_file, transform=pytorch_transform):
+    """
+    Preprocess the uploaded image (file or decoded PIL image) for PyTorch CORAL model prediction
+    """
+    # Read image
+    img = image_file if isinstance(image_file, Image.Image) else load_image(image_file)
+
+    try:
+        # Apply transforms (resize, normalize)
+        img_tensor = transform(img)
+
+        # Add batch dimension
+        img_batch = img_tensor.unsqueeze(0)
+
+        return img_batch
+    except Exception as e:
+        raise ValueError(f"Error processing image: {str(e)}")
+
+
+def coral_class_probabilities(sigmoid_outputs):
+    """
+    Convert CORAL ordinal outputs (batch, K-1) to class probabilities (batch, K)
+    P(y=0) = 1 - P(y>0), P(y=k) = P(y>k-1) - P(y>k), P(y=K-1) = P(y>K-2)
+    """
+    batch = sigmoid_outputs.shape[0]
+    ones = np.ones((batch, 1), dtype=sigmoid_outputs.dtype)
+    zeros = np.zeros((batch, 1), dtype=sigmoid_outputs.dtype)
+    cumulative = np.concatenate([ones, sigmoid_outputs, zeros], axis=1)
+    return cumulative[:, :-1] - cumulative[:, 1:]
+
+
+class ExplanationCache:
+    """Thread-safe LRU cache of explained predictions, keyed by image content hash"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+            return copy.deepcopy(result)
+
+    def put(self, key, result):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = copy.deepcopy(result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+explanation_cache = ExplanationCache(GRADCAM_CACHE_SIZE)
+
+
+def gradcam_overlay_png(img_tensor, cam):
+    """
+    Blend a Grad-CAM heatmap over the (224x224) model input and encode it as PNG
+    Returns a base64 data URI
+    """
+    # Undo ImageNet normalization to recover the displayed image
+    image = img_tensor.cpu() * torch.tensor(IMAGENET_STD).view(3, 1, 1) + torch.tensor(IMAGENET_MEAN).view(3, 1, 1)
+    image = image.clamp(0, 1).permute(1, 2, 0).numpy()
+
+    # Jet colormap without pulling in matplotlib
+    cam = cam.cpu().numpy()[..., np.newaxis]
+    heatmap = np.clip(1.5 - np.abs(4 * cam - np.array([3.0, 2.0, 1.0])), 0, 1)
+
+    overlay = (1 - GRADCAM_ALPHA) * image + GRADCAM_ALPHA * heatmap
+    buffer = io.BytesIO()
+    Image.fromarray((overlay * 255).astype(np.uint8)).save(buffer, format='PNG', optimize=True)
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def predict_coral(file, explain=False, cascade=None):
+    """
+    Make prediction using CORAL ordinal regression model
+    explain=True adds a Grad-CAM overlay for the predicted threshold (cached by image hash)
+    cascade=True tries a low-res pass first (default: CASCADE_ENABLED; ignored when explaining)
+    """
+    if coral_model is None:
+        raise Exception("CORAL model not loaded")
+
+    if cascade is None:
+        cascade = CASCADE_ENABLED
+
+    cache_key = None
+    if explain:
+        file.seek(0)
+        cache_key = hashlib.sha256(file.read()).hexdigest()
+        cached = explanation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    # Decode once; each stage applies its own resize + normalize
+    file.seek(0)  # Reset file pointer
+    img = load_image(file)
+
+    cam = None
+    outputs = None
+    cascade_info = None
+    if explain:
+        # Grad-CAM needs gradients, so outputs come from the same forward + backward pass
+        img_tensor = preprocess_image_pytorch(img).to(DEVICE)
+        outputs, cams = coral_gradcam(coral_model, img_tensor)
+        cam = cams[0]
+    elif cascade:
+        with torch.no_grad():
+            low_res_outputs = coral_model(preprocess_image_pytorch(img, cascade_transform).to(DEVICE))
+        escalated = bool(coral_uncertain(low_res_outputs, CASCADE_MARGIN)[0])
+        if not escalated:
+            outputs = low_res_outputs
+        cascade_info = {
+            'escalated': escalated,
+            'resolution': 224 if escalated else CASCADE_RESOLUTION,
+            'margin': CASCADE_MARGIN
+        }
+
+    # Make prediction (no gradient needed for inference)
+    with torch.no_grad():
+        if outputs is None:
+            outputs = coral_model(preprocess_image_pytorch(img).to(DEVICE))
+        predicted_class_tensor = coral_predict(outputs)
+        predicted_class = int(predicted_class_tensor[0].item())
+
+        sigmoid_outputs = outputs[0].cpu().numpy()
+
+        # Convert CORAL ordinal outputs to class probabilities
+        class_probs = coral_class_probabilities(sigmoid_outputs[np.newaxis])[0]
+
+        confidence = float(class_probs[predicted_class])
+
+    stage_info = STAGE_DESCRIPTIONS.get(predicted_class, {
+        "severity": "Unknown",
+        "explanation": "Unable to determine severity."
+    })
+
+    result = {
+        'grade': predicted_class,
+        'severity': stage_info['severity'],
+        'confidence': round(confidence * 100, 2),
+        'explanation': stage_info['explanation'],
+        'probabilities': {f"grade_{i}": float(class_probs[i]) for i in range(NUM_CLASSES)},
+        'model_type': 'CORAL Ordinal Regression (EfficientNet-B0)',
+        'model_description': 'Uses ordinal regression with CORAL loss to predict ordered KL grades. Leverages the ordinal nature of severity levels for more consistent predictions.',
+        'ordinal_outputs': sigmoid_outputs.tolist()
+    }
+
+    if cascade_info is not None:
+        result['cascade'] = cascade_info
+
+    if explain:
+        result['gradcam'] = {
+            'image': gradcam_overlay_png(img_tensor[0], cam),
+            'threshold': max(predicted_class - 1, 0),
+            'description': f"Regions supporting P(grade > {predicted_class - 1})" if predicted_class > 0
+                           else "Regions weighing against P(grade > 0)"
+        }
+        explanation_cache.put(cache_key, result)
+
+    return result
+
+
+def predict_coral_batch(images, layout):
+    """
+    Run the CORAL model on an already decoded batch from the binary protocol
+    images: uint8 NHWC pixels or normalized float32 NCHW tensor, shape-checked by
+            binary_protocol.decode_request (no resize is applied)
+    Returns (grades, ordinal_outputs, class_probabilities) as numpy arrays
+    """
+    if coral_model is None:
+        raise Exception("CORAL model not loaded")
+
+    img_tensor = torch.from_numpy(np.array(images)).to(DEVICE)
+    if layout == binary_protocol.LAYOUT_NHWC:
+        img_tensor = img_tensor.permute(0, 3, 1, 2).float().div_(255.0)
+        img_tensor = (img_tensor - _mean_tensor) / _std_tensor
+
+    with torch.no_grad():
+        outputs = coral_model(img_tensor)
+        grades = coral_predict(outputs).cpu().numpy()
+        sigmoid_outputs = outputs.cpu().numpy()
+
+    return grades, sigmoid_outputs, coral_class_probabilities(sigmoid_outputs)
+
+
+def predict_binary(body, max_batch=None):
+    """
+    Decode a binary protocol request, run the batch and encode the response body
+    Raises ValueError for malformed requests
+    """
+    images, layout = binary_protocol.decode_request(body, max_batch=max_batch)
+    grades, sigmoid_outputs, class_probs = predict_coral_batch(images, layout)
+    return binary_protocol.encode_response(grades, sigmoid_outputs, class_probs)
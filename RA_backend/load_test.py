@@ -0,0 +1,445 @@
+"""
+Load-testing harness for the RA Detection Backend API
+Replays synthetic X-ray uploads against a local or remote server and reports
+throughput, latency percentiles, error/timeout rates and server CPU/RSS.
+
+Usage:
+    python load_test.py                                   # all scenarios in load_test_scenarios.json
+    python load_test.py --scenario gunicorn-2w-2t         # a single scenario
+    python load_test.py --url http://host:5000            # target a running server (no local start)
+    python load_test.py --output results/load_test.json   # also save the full results
+"""
+
+import argparse
+import io
+import json
+import os
+import secrets
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image
+
+import binary_protocol
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Configuration
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(BACKEND_DIR, "load_test_scenarios.json")
+DEFAULT_SETTINGS = {
+    "mode": "concurrency",          # "concurrency" (closed loop) or "rate" (open loop)
+    "concurrency": 4,
+    "rate": 2.0,                    # requests per second in "rate" mode
+    "max_in_flight": 64,            # cap on outstanding requests in "rate" mode
+    "duration": 30,                 # seconds
+    "warmup": 3,                    # seconds of traffic excluded from the report
+    "timeout": 30,                  # per-request timeout in seconds
+    "endpoint": "/predict",
+    "batch_size": 1,                # images per request for /predict/binary
+    "image_sizes": [[512, 512], [1024, 1024], [2048, 2560]],
+    "image_format": "PNG",
+    "api_token": None,              # X-API-Token for /predict/binary (default: BINARY_API_TOKEN env var)
+    "server": None,                 # command to start locally, {port} is substituted
+    "port": 5050,
+    "startup_timeout": 180,
+    "server_log": "load_test_{name}.log",  # server stdout/stderr, {name} is the scenario name
+    "sample_interval": 1.0,         # seconds between server CPU/RSS samples
+}
+
+
+# ------------------------------
+# Synthetic payloads
+# ------------------------------
+
+def synthetic_xray(width, height, seed):
+    """Grayscale image with a bright bone-like band and noise, roughly like a knee X-ray"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(-1.0, 1.0, width)[np.newaxis, :]
+    y = np.linspace(-1.0, 1.0, height)[:, np.newaxis]
+    bone = np.exp(-(x / 0.35) ** 2) * (0.6 + 0.4 * np.cos(6 * y))
+    noise = rng.normal(0.0, 0.08, size=(height, width))
+    pixels = np.clip((0.15 + 0.7 * bone + noise) * 255, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels, mode="L")
+
+
+def build_payloads(settings):
+    """Pre-encode one payload per configured image size so encoding stays off the hot path"""
+    payloads = []
+    for i, (width, height) in enumerate(settings["image_sizes"]):
+        img = synthetic_xray(width, height, seed=i)
+
+        if settings["endpoint"] == "/predict/binary":
+            pixels = np.asarray(img.convert("RGB").resize((224, 224), Image.BILINEAR))
+            batch = np.repeat(pixels[np.newaxis], settings["batch_size"], axis=0)
+            payloads.append(("binary", binary_protocol.encode_request(batch)))
+        else:
+            buffer = io.BytesIO()
+            img.save(buffer, format=settings["image_format"])
+            ext = ".png" if settings["image_format"].upper() == "PNG" else ".jpg"
+            payloads.append(("file", (f"xray_{width}x{height}{ext}", buffer.getvalue())))
+
+    return payloads
+
+
+# ------------------------------
+# Requests
+# ------------------------------
+
+def send_request(session, url, payload, settings):
+    """Send one request and return (status, error) where status is 'ok', 'error' or 'timeout'"""
+    kind, data = payload
+    timeout = settings["timeout"]
+    try:
+        if kind == "binary":
+            headers = {"Content-Type": binary_protocol.CONTENT_TYPE}
+            if settings["api_token"]:
+                headers["X-API-Token"] = settings["api_token"]
+            response = session.post(url, data=data, timeout=timeout, headers=headers)
+        else:
+            filename, content = data
+            response = session.post(url, files={"file": (filename, content)}, timeout=timeout)
+    except requests.Timeout:
+        return "timeout", "timeout"
+    except requests.RequestException as e:
+        return "error", type(e).__name__
+
+    if response.status_code != 200:
+        return "error", f"HTTP {response.status_code}"
+    return "ok", None
+
+
+class Recorder:
+    """Thread-safe collector of (start, latency, status, error) samples"""
+
+    def __init__(self):
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def record(self, start, latency, status, error):
+        with self.lock:
+            self.samples.append((start, latency, status, error))
+
+
+_thread_local = threading.local()
+
+
+def _session():
+    # One keep-alive session per client thread
+    if not hasattr(_thread_local, "session"):
+        _thread_local.session = requests.Session()
+    return _thread_local.session
+
+
+def run_concurrency(url, payloads, settings, recorder, deadline):
+    """Closed loop: N clients each send the next request as soon as the previous one returns"""
+    def client(worker_id):
+        i = worker_id
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status, error = send_request(_session(), url, payloads[i % len(payloads)], settings)
+            recorder.record(start, time.perf_counter() - start, status, error)
+            i += 1
+
+    threads = [threading.Thread(target=client, args=(n,), daemon=True) for n in range(settings["concurrency"])]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run_rate(url, payloads, settings, recorder, deadline):
+    """
+    Open loop: requests are issued on a fixed schedule regardless of response times.
+    Latency is measured from the scheduled send time, so queueing delay is not hidden.
+    """
+    interval = 1.0 / settings["rate"]
+    in_flight = threading.BoundedSemaphore(settings["max_in_flight"])
+
+    def task(scheduled, payload):
+        try:
+            status, error = send_request(_session(), url, payload, settings)
+            recorder.record(scheduled, time.perf_counter() - scheduled, status, error)
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=settings["max_in_flight"]) as pool:
+        i = 0
+        next_send = time.perf_counter()
+        while next_send < deadline:
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            if in_flight.acquire(blocking=False):
+                pool.submit(task, next_send, payloads[i % len(payloads)])
+            else:
+                recorder.record(next_send, 0.0, "error", "client saturated")
+
+            i += 1
+            next_send += interval
+
+
+# ------------------------------
+# Server process
+# ------------------------------
+
+def start_server(settings):
+    """
+    Start the configured server command and wait until /health reports the model loaded
+    Server output goes to settings["server_log"]; stops early if the model failed to load
+    """
+    port = settings["port"]
+    command = shlex.split(settings["server"].format(port=port))
+    env = dict(os.environ, PORT=str(port))
+    if settings["api_token"]:
+        env["BINARY_API_TOKEN"] = settings["api_token"]  # /predict/binary is disabled without it
+
+    log_path = os.path.abspath(settings["server_log"].format(name=settings["name"]))
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    print(f"  Server log: {log_path}")
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + settings["startup_timeout"]
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited during startup with code {process.returncode}; see {log_path}")
+        try:
+            health = requests.get(f"{base_url}/health", timeout=2).json()
+            if health.get("coral_model_loaded"):
+                return process, base_url
+            if health.get("model_status") == "failed":
+                report = requests.get(f"{base_url}/startup", timeout=2).json().get("report") or {}
+                stop_server(process)
+                raise RuntimeError(f"Model failed to load: {report.get('error', 'unknown error')}; see {log_path}")
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+
+    stop_server(process)
+    raise RuntimeError(f"Server not ready after {settings['startup_timeout']}s; see {log_path}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+class ResourceSampler(threading.Thread):
+    """Samples CPU% and RSS of a server process and its children (e.g. gunicorn workers)"""
+
+    def __init__(self, pid, interval):
+        super().__init__(daemon=True)
+        self.root = psutil.Process(pid)
+        self.interval = interval
+        self.samples = []
+        self.stop_event = threading.Event()
+        # cpu_percent() measures since the previous call on the same Process object,
+        # so the objects are kept across samples instead of re-listing children each time
+        self.processes = {}
+
+    def _refresh_processes(self):
+        """Track new PIDs (primed, reported from the next sample on) and drop exited ones"""
+        try:
+            current = [self.root] + self.root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            current = []
+
+        alive = set()
+        for proc in current:
+            alive.add(proc.pid)
+            if proc.pid not in self.processes:
+                try:
+                    proc.cpu_percent(None)  # prime the counter
+                except psutil.NoSuchProcess:
+                    continue
+                self.processes[proc.pid] = proc
+
+        for pid in list(self.processes):
+            if pid not in alive:
+                del self.processes[pid]
+
+    def run(self):
+        start = time.perf_counter()
+        self._refresh_processes()
+
+        while not self.stop_event.wait(self.interval):
+            cpu, rss = 0.0, 0
+            for proc in list(self.processes.values()):
+                try:
+                    cpu += proc.cpu_percent(None)
+                    rss += proc.memory_info().rss
+                except psutil.NoSuchProcess:
+                    continue
+            self._refresh_processes()
+            self.samples.append({
+                "t": round(time.perf_counter() - start, 2),
+                "cpu_percent": round(cpu, 1),
+                "rss_mb": round(rss / 2**20, 1),
+            })
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+# ------------------------------
+# Scenario runner
+# ------------------------------
+
+def summarize(samples, measure_start, measure_end, images_per_request=1):
+    """Aggregate samples whose request started inside the measurement window"""
+    window = [s for s in samples if measure_start <= s[0] < measure_end]
+    total = len(window)
+    elapsed = measure_end - measure_start
+    ok_latencies = np.array([s[1] for s in window if s[2] == "ok"]) * 1000.0
+
+    errors = {}
+    for s in window:
+        if s[3]:
+            errors[s[3]] = errors.get(s[3], 0) + 1
+
+    summary = {
+        "requests": total,
+        "throughput_rps": round(len(ok_latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "throughput_ips": round(len(ok_latencies) * images_per_request / elapsed, 2) if elapsed > 0 else 0.0,
+        "error_rate": round(sum(1 for s in window if s[2] == "error") / total, 4) if total else 0.0,
+        "timeout_rate": round(sum(1 for s in window if s[2] == "timeout") / total, 4) if total else 0.0,
+        "errors": errors,
+    }
+    if len(ok_latencies):
+        p50, p95, p99 = np.percentile(ok_latencies, [50, 95, 99])
+        summary.update({
+            "latency_ms_p50": round(float(p50), 1),
+            "latency_ms_p95": round(float(p95), 1),
+            "latency_ms_p99": round(float(p99), 1),
+            "latency_ms_max": round(float(ok_latencies.max()), 1),
+        })
+    return summary
+
+
+def run_scenario(scenario, target_url=None):
+    settings = dict(DEFAULT_SETTINGS, **scenario)
+    if settings["api_token"] is None:
+        settings["api_token"] = os.environ.get("BINARY_API_TOKEN")
+    print(f"\n▶ Scenario: {settings['name']}")
+
+    process = None
+    if target_url:
+        base_url = target_url.rstrip("/")
+    elif settings["server"]:
+        print(f"  Starting server: {settings['server'].format(port=settings['port'])}")
+        if not settings["api_token"]:
+            settings["api_token"] = secrets.token_hex(16)
+        process, base_url = start_server(settings)
+    else:
+        raise ValueError(f"Scenario '{settings['name']}' has no 'server' command; pass --url")
+
+    sampler = None
+    if process is not None:
+        if psutil is not None:
+            sampler = ResourceSampler(process.pid, settings["sample_interval"])
+            sampler.start()
+        else:
+            print("  ⚠️  psutil not installed, skipping server CPU/RSS sampling")
+
+    try:
+        payloads = build_payloads(settings)
+        url = f"{base_url}{settings['endpoint']}"
+        recorder = Recorder()
+
+        start = time.perf_counter()
+        measure_start = start + settings["warmup"]
+        deadline = measure_start + settings["duration"]
+
+        runner = run_rate if settings["mode"] == "rate" else run_concurrency
+        runner(url, payloads, settings, recorder, deadline)
+
+        images_per_request = settings["batch_size"] if settings["endpoint"] == "/predict/binary" else 1
+        summary = summarize(recorder.samples, measure_start, deadline, images_per_request)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        if process is not None:
+            stop_server(process)
+
+    # Don't write the token into --output files
+    result = {"name": settings["name"], "settings": dict(settings, api_token=None), "summary": summary}
+    if sampler is not None and sampler.samples:
+        result["server_resources"] = sampler.samples
+        summary["cpu_percent_mean"] = round(float(np.mean([s["cpu_percent"] for s in sampler.samples])), 1)
+        summary["rss_mb_max"] = max(s["rss_mb"] for s in sampler.samples)
+
+    print_summary(summary)
+    return result
+
+
+def print_summary(summary):
+    print(f"  Requests:    {summary['requests']}")
+    print(f"  Throughput:  {summary['throughput_rps']} req/s | {summary['throughput_ips']} images/s")
+    if "latency_ms_p50" in summary:
+        print(f"  Latency:     p50 {summary['latency_ms_p50']} ms | p95 {summary['latency_ms_p95']} ms | "
+              f"p99 {summary['latency_ms_p99']} ms | max {summary['latency_ms_max']} ms")
+    print(f"  Errors:      {summary['error_rate'] * 100:.2f}% | Timeouts: {summary['timeout_rate'] * 100:.2f}%")
+    if summary["errors"]:
+        print(f"  Error kinds: {summary['errors']}")
+    if "cpu_percent_mean" in summary:
+        print(f"  Server:      mean CPU {summary['cpu_percent_mean']}% | peak RSS {summary['rss_mb_max']} MB")
+
+
+def print_comparison(results):
+    print("\n" + "=" * 96)
+    print(f"{'scenario':<24}{'rps':>8}{'img/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err %':>8}{'cpu %':>8}{'rss MB':>8}")
+    print("-" * 96)
+    for r in results:
+        s = r["summary"]
+        print(f"{r['name']:<24}{s['throughput_rps']:>8}{s['throughput_ips']:>10}{s.get('latency_ms_p50', '-'):>10}"
+              f"{s.get('latency_ms_p95', '-'):>10}{s.get('latency_ms_p99', '-'):>10}"
+              f"{(s['error_rate'] + s['timeout_rate']) * 100:>8.2f}"
+              f"{s.get('cpu_percent_mean', '-'):>8}{s.get('rss_mb_max', '-'):>8}")
+    print("=" * 96)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the RA Detection Backend API")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Scenario config file (JSON)")
+    parser.add_argument("--scenario", action="append", help="Run only the named scenario(s)")
+    parser.add_argument("--url", help="Target a running server instead of starting one")
+    parser.add_argument("--output", help="Write full results (incl. CPU/RSS time series) to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    defaults = config.get("defaults", {})
+    scenarios = [dict(defaults, **s) for s in config["scenarios"]]
+    if args.scenario:
+        scenarios = [s for s in scenarios if s["name"] in args.scenario]
+        if not scenarios:
+            print(f"❌ No scenario named {args.scenario} in {args.config}")
+            sys.exit(1)
+
+    results = [run_scenario(s, target_url=args.url) for s in scenarios]
+    print_comparison(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ import requests
 import os
 import sys
 
+import binary_protocol
+
 # Configuration
 BASE_URL = "http://localhost:5000"
 TEST_IMAGE_PATH = "test_image.jpg"  # Change this to your test image path
@@ -37,6 +39,33 @@ def test_health_check():
         return False
 
 
+def test_startup_report():
+    """Check that initialize() finished and recorded its import breakdown"""
+    print("\n" + "="*50)
+    print("Testing Startup Report")
+    print("="*50)
+    
+    try:
+        result = requests.get(f"{BASE_URL}/startup").json()
+        report = result.get('report') or {}
+        print(f"Model status: {result['model_status']}")
+        
+        if result['model_status'] != 'ready':
+            print(f"❌ Model not ready: {report.get('error', 'no error recorded')}")
+            return False
+        if not report.get('slowest_imports'):
+            print("❌ Startup report has no per-module import timings")
+            return False
+        
+        slowest = report['slowest_imports'][0]
+        print(f"Modules imported: {report['modules_imported']}, slowest: {slowest['module']} ({slowest['self_ms']} ms)")
+        print("✅ Startup report OK!")
+        return True
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
+
+
 def test_prediction(image_path):
     """Test the prediction endpoint"""
     print("\n" + "="*50)
@@ -88,6 +117,58 @@ def test_prediction(image_path):
         return False
 
 
+def test_binary_roundtrip(image_path):
+    """Compare the binary endpoint against the JSON endpoint on the same image"""
+    print("\n" + "="*50)
+    print("Testing Binary Endpoint Round-Trip")
+    print("="*50)
+    
+    if not os.path.exists(image_path):
+        print(f"❌ Test image not found: {image_path}")
+        return False
+    
+    try:
+        import numpy as np
+        from PIL import Image
+        
+        with open(image_path, 'rb') as f:
+            json_result = requests.post(f"{BASE_URL}/predict", files={'file': f}).json()
+        
+        # With CASCADE_ENABLED the JSON answer may come from the low-res pass,
+        # while the binary endpoint always runs at full resolution
+        if not json_result.get('cascade', {}).get('escalated', True):
+            print("⚠️  /predict answered from the low-res cascade pass; skipping comparison")
+            print("   Restart the server without CASCADE_ENABLED to run this test")
+            return True
+        
+        # Same decode + resize as the server-side transform, done on the client
+        img = Image.open(image_path).convert('RGB').resize((224, 224), Image.BILINEAR)
+        pixels = np.asarray(img, dtype=np.uint8)
+        batch = np.stack([pixels, pixels])
+        
+        result = binary_protocol.predict_binary(BASE_URL, batch, token=os.environ.get('BINARY_API_TOKEN'))
+        json_probs = np.array([json_result['probabilities'][f"grade_{i}"] for i in range(result['probabilities'].shape[1])])
+        
+        ok = True
+        for i in range(len(batch)):
+            if int(result['grades'][i]) != json_result['grade']:
+                print(f"❌ Grade mismatch in item {i}: {result['grades'][i]} vs {json_result['grade']}")
+                ok = False
+            if not np.allclose(result['ordinal_outputs'][i], json_result['ordinal_outputs'], atol=1e-4):
+                print(f"❌ Ordinal outputs mismatch in item {i}")
+                ok = False
+            if not np.allclose(result['probabilities'][i], json_probs, atol=1e-4):
+                print(f"❌ Probabilities mismatch in item {i}")
+                ok = False
+        
+        if ok:
+            print("✅ Binary endpoint matches JSON endpoint!")
+        return ok
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
+
+
 def test_invalid_file():
     """Test error handling with invalid file"""
     print("\n" + "="*50)
@@ -120,13 +201,17 @@ def main():
         print("\n❌ Backend server is not accessible. Exiting.")
         sys.exit(1)
     
-    # Test 2: Error Handling
+    # Test 2: Startup report (the model must have loaded)
+    test_startup_report()
+    
+    # Test 3: Error Handling
     test_invalid_file()
     
-    # Test 3: Prediction (if test image is provided)
+    # Test 4: Prediction (if test image is provided)
     if len(sys.argv) > 1:
         test_image = sys.argv[1]
         test_prediction(test_image)
+        test_binary_roundtrip(test_image)
     else:
         print("\n" + "="*50)
         print("Skipping prediction test")